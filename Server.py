@@ -11,11 +11,21 @@ import json
 import socket
 import subprocess
 import re
+import sys
+import signal
+import random
+import queue
+import contextlib
+import hashlib
+import multiprocessing
+from multiprocessing.connection import wait
+from multiprocessing.managers import BaseManager
 from flask import Flask, request, Response
 from flask_cors import CORS
 import xml.etree.ElementTree as ET
 import xmlrpc.client
 import requests  # Agregado para enviar notificaciones HTTP
+from werkzeug.serving import make_server
 
 def obtener_ip_real():
     try:
@@ -39,9 +49,28 @@ def obtener_ip_real():
 # Configuración
 BALANCEADOR_IP = os.environ.get("BALANCEADOR_IP", "192.168.154.129")
 BALANCEADOR_RPC_URL = f"http://{BALANCEADOR_IP}:8000"
+# Conexiones al balanceador abiertas y verificadas con ping antes de declararse listo.
+# Sólo quedan abiertas si el balanceador responde con HTTP/1.1 keep-alive (en SimpleXMLRPCServer,
+# un requestHandler con protocol_version = "HTTP/1.1", como en balanceador_prueba.py)
+BALANCEADOR_CONEXIONES_PREVIAS = int(os.environ.get("BALANCEADOR_CONEXIONES_PREVIAS", "2"))
+BALANCEADOR_POOL_MAX = int(os.environ.get("BALANCEADOR_POOL_MAX", "8"))
+BALANCEADOR_TIMEOUT = float(os.environ.get("BALANCEADOR_TIMEOUT", "5"))  # sólo para el ping de calentamiento
+# Margen que se suma al plazo enviado al balanceador: la cancelación del gateway llega primero
+# y el plazo sólo actúa como respaldo si la cancelación se pierde
+PLAZO_MARGEN = float(os.environ.get("PLAZO_MARGEN", "1.0"))
 NOTIFICADOR_IP = "192.168.154.130"
 NOTIFICADOR_PORT = 5002  # Asumiendo puerto 5002 para server2.py
 NOTIFICADOR_URL = f"http://{NOTIFICADOR_IP}:{NOTIFICADOR_PORT}/notificacion"
+# Modo prefork: con GATEWAY_WORKERS > 1 se levantan N procesos trabajadores que comparten
+# el estado de tareas a través de un coordinador local (socket Unix) con un único monitor.
+GATEWAY_WORKERS = int(os.environ.get("GATEWAY_WORKERS", "1"))
+# El puerto va en la ruta para que dos gateways en la misma máquina no compartan coordinador
+GATEWAY_SOCKET = os.environ.get("GATEWAY_SOCKET", f"/tmp/sda-pixpar-tareas-{os.environ.get('PORT', 5001)}.sock")
+# Captura de tráfico (opcional): registros JSONL muestreados para reproducir con reproducir_trafico.py
+CAPTURA_TRAFICO = os.environ.get("CAPTURA_TRAFICO", "0") == "1"
+CAPTURA_ARCHIVO = os.environ.get("CAPTURA_ARCHIVO", "trafico_capturado.jsonl")
+CAPTURA_MUESTREO = float(os.environ.get("CAPTURA_MUESTREO", "1.0"))
+CAPTURA_MAX_BYTES = int(os.environ.get("CAPTURA_MAX_BYTES", "65536"))  # cuerpos mayores sólo guardan el hash
 
 app = Flask(__name__)
 CORS(app, origins="*", allow_headers=["Content-Type", "SOAPAction", "Authorization"], methods=["GET", "POST", "OPTIONS"])
@@ -59,55 +88,185 @@ def enviar_notificacion(evento, hora=None):
     except Exception as e:
         print(f"Error enviando notificación: {str(e)}")  # No rompe el flujo principal
 
-class SOAPImageService:
+class AlmacenTareas:
+    """Estado de tareas activas. Quien espera una tarea se despierta cuando el monitor la actualiza."""
     def __init__(self):
+        self._tareas = {}
+        self._cond = threading.Condition()
+        self._cancelaciones = 0
+        self._segundos_desperdiciados = 0.0
+
+    def registrar(self, task_id, info):
+        with self._cond:
+            self._tareas[task_id] = dict(info)
+
+    def ids(self):
+        with self._cond:
+            return list(self._tareas.keys())
+
+    def contar(self):
+        with self._cond:
+            return len(self._tareas)
+
+    def actualizar(self, task_id, cambios):
+        with self._cond:
+            if task_id not in self._tareas:
+                return False
+            self._tareas[task_id].update(cambios)
+            self._cond.notify_all()
+            return True
+
+    def esperar(self, task_id, timeout):
+        # Devuelve una copia de la tarea en cuanto deja de estar "procesando" o al vencer el timeout
+        with self._cond:
+            self._cond.wait_for(lambda: self._tareas.get(task_id, {}).get("status") != "procesando",
+                                timeout=timeout)
+            tarea = self._tareas.get(task_id)
+            return dict(tarea) if tarea is not None else None
+
+    def retirar(self, task_id):
+        with self._cond:
+            return self._tareas.pop(task_id, None)
+
+    def contabilizar_cancelacion(self, segundos):
+        with self._cond:
+            self._cancelaciones += 1
+            self._segundos_desperdiciados += segundos
+
+    def metricas(self):
+        with self._cond:
+            return {
+                "cancelaciones": self._cancelaciones,
+                "segundos_desperdiciados": round(self._segundos_desperdiciados, 3)
+            }
+
+class ManagerAlmacen(BaseManager):
+    """Expone un AlmacenTareas por socket Unix para los procesos trabajadores."""
+    pass
+
+class TransporteConTimeout(xmlrpc.client.Transport):
+    """Transporte XML-RPC con timeout para que un balanceador caído no cuelgue el calentamiento."""
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        conexion = super().make_connection(host)
+        conexion.timeout = self.timeout
+        return conexion
+
+    def quitar_timeout(self):
+        # Tras el ping la conexión queda abierta (keep-alive) y se usa sin límite de tiempo
+        self.timeout = None
+        conexion = self._connection[1]
+        if conexion is not None:
+            conexion.timeout = None
+            if conexion.sock is not None:
+                conexion.sock.settimeout(None)
+
+def crear_cliente_balanceador(transporte=None):
+    return xmlrpc.client.ServerProxy(BALANCEADOR_RPC_URL, allow_none=True, transport=transporte)
+
+class SOAPImageService:
+    def __init__(self, almacen=None, monitor=True, con_pool=True):
+        # balanceador_client es la conexión del monitor; las peticiones usan el pool
         self.balanceador_client = None
-        self.tareas_activas = {}
-        self.lock = threading.Lock()
-        self._conectar_balanceador()
-        threading.Thread(target=self._monitor_tareas, daemon=True).start()
+        self.pool = queue.Queue(maxsize=max(BALANCEADOR_POOL_MAX, BALANCEADOR_CONEXIONES_PREVIAS))
+        self.estado = "warming"
+        self.inicio = time.time()
+        self.tiempo_hasta_listo = None
+        self.almacen = almacen if almacen is not None else AlmacenTareas()
+        self.con_monitor = monitor
+        self.con_pool = con_pool
+        self.soporta_plazo = None  # se averigua con la primera tarea enviada
+        # La conexión se hace en segundo plano para que Flask abra el puerto de inmediato
+        threading.Thread(target=self._calentar_conexiones, daemon=True).start()
+        if monitor:
+            threading.Thread(target=self._monitor_tareas, daemon=True).start()
+
+    def _calentar_conexiones(self):
+        listas = 0
+        # Con monitor se reserva una conexión sólo para él; el coordinador no atiende peticiones
+        # y no necesita pool
+        previas = BALANCEADOR_CONEXIONES_PREVIAS if self.con_pool else 0
+        objetivo = previas + (1 if self.con_monitor else 0)
+        while listas < objetivo:
+            transporte = TransporteConTimeout(BALANCEADOR_TIMEOUT)
+            cliente = crear_cliente_balanceador(transporte)
+            try:
+                cliente.ping()
+            except Exception as e:
+                print(f"❌ Error conectando con balanceador RPC: {e}")
+                cliente("close")()
+                time.sleep(1)
+                continue
+            # El timeout corto es sólo para el calentamiento: procesar_tarea puede tardar más
+            # y cortarla dejaría en el balanceador una tarea que nadie cancela
+            transporte.quitar_timeout()
+            if self.con_monitor and self.balanceador_client is None:
+                self.balanceador_client = cliente
+            else:
+                self.pool.put(cliente)
+                if self.balanceador_client is None:
+                    self.balanceador_client = cliente
+            listas += 1
+        self.tiempo_hasta_listo = time.time() - self.inicio
+        self.estado = "ready"
+        print(f"✅ Conectado al balanceador RPC: {BALANCEADOR_RPC_URL} "
+              f"({previas} conexiones, listo en {self.tiempo_hasta_listo:.3f}s)")
 
-    def _conectar_balanceador(self):
+    @contextlib.contextmanager
+    def _conexion(self):
+        """Presta una conexión del pool; si ya está listo y no quedan libres, abre una nueva."""
+        try:
+            cliente = self.pool.get_nowait()
+        except queue.Empty:
+            if self.estado == "ready":
+                cliente = crear_cliente_balanceador()
+            else:
+                try:
+                    cliente = self.pool.get(timeout=BALANCEADOR_TIMEOUT)
+                except queue.Empty:
+                    raise Exception("No se puede conectar con el balanceador")
         try:
-            self.balanceador_client = xmlrpc.client.ServerProxy(BALANCEADOR_RPC_URL, allow_none=True)
-            # ping try
+            yield cliente
+        finally:
             try:
-                self.balanceador_client.ping()
-            except:
-                pass
-            print(f"✅ Conectado al balanceador RPC: {BALANCEADOR_RPC_URL}")
-        except Exception as e:
-            print(f"❌ Error conectando con balanceador RPC: {e}")
-            self.balanceador_client = None
+                self.pool.put_nowait(cliente)
+            except queue.Full:
+                # Conexión abierta en un pico de concurrencia: se descarta para no crecer sin límite
+                cliente("close")()
 
     def _monitor_tareas(self):
         while True:
             try:
                 if not self.balanceador_client:
-                    self._conectar_balanceador()
-                    time.sleep(5)
+                    time.sleep(1)
                     continue
-                with self.lock:
-                    tareas_a_verificar = list(self.tareas_activas.keys())
+                tareas_a_verificar = self.almacen.ids()
                 for task_id in tareas_a_verificar:
                     try:
                         resultado_json = self.balanceador_client.obtener_resultado(task_id)
                         if resultado_json:
                             resultado = json.loads(resultado_json)
-                            with self.lock:
-                                if task_id in self.tareas_activas:
-                                    if resultado.get("status") == "completado":
-                                        self.tareas_activas[task_id]["status"] = "completado"
-                                        self.tareas_activas[task_id]["xml_result"] = resultado.get("resultado", "")
-                                        self.tareas_activas[task_id]["tiempo_proceso"] = resultado.get("tiempo_proceso", 0)
-                                        self.tareas_activas[task_id]["nodo_procesado"] = resultado.get("nodo_procesado", "")
-                                        # Notificación al final de la actualización de tarea completada
-                                        enviar_notificacion(f"Tarea {task_id} completada en nodo {resultado.get('nodo_procesado', 'desconocido')}")
-                                    elif resultado.get("status") == "error":
-                                        self.tareas_activas[task_id]["status"] = "error"
-                                        self.tareas_activas[task_id]["error"] = resultado.get("error", "Error desconocido")
-                                        # Notificación al final de la actualización de tarea con error
-                                        enviar_notificacion(f"Tarea {task_id} fallida: {resultado.get('error', 'Error desconocido')}")
+                            if resultado.get("status") == "completado":
+                                actualizada = self.almacen.actualizar(task_id, {
+                                    "status": "completado",
+                                    "xml_result": resultado.get("resultado", ""),
+                                    "tiempo_proceso": resultado.get("tiempo_proceso", 0),
+                                    "nodo_procesado": resultado.get("nodo_procesado", "")
+                                })
+                                if actualizada:
+                                    # Notificación al final de la actualización de tarea completada
+                                    enviar_notificacion(f"Tarea {task_id} completada en nodo {resultado.get('nodo_procesado', 'desconocido')}")
+                            elif resultado.get("status") == "error":
+                                actualizada = self.almacen.actualizar(task_id, {
+                                    "status": "error",
+                                    "error": resultado.get("error", "Error desconocido")
+                                })
+                                if actualizada:
+                                    # Notificación al final de la actualización de tarea con error
+                                    enviar_notificacion(f"Tarea {task_id} fallida: {resultado.get('error', 'Error desconocido')}")
                     except Exception as e:
                         # no romper el hilo por un fallo en una tarea
                         print(f"Error verificando tarea {task_id}: {e}")
@@ -117,51 +276,51 @@ class SOAPImageService:
                 time.sleep(5)
 
     def procesar_imagenes_auto(self, xml_content, prioridad=5, tipo_servicio="procesamiento_batch", 
-                              formato_salida="JPEG", calidad=85, poll_interval=3.0, max_attempts=30):
+                              formato_salida="JPEG", calidad=85, poll_interval=3.0, max_attempts=30,
+                              cliente_conectado=None):
         try:
-            if not self.balanceador_client:
-                self._conectar_balanceador()
-                if not self.balanceador_client:
-                    raise Exception("No se puede conectar con el balanceador")
-            task_id = self.balanceador_client.procesar_tarea(xml_content, prioridad, tipo_servicio, formato_salida, calidad)
+            # El plazo viaja en segundos relativos (no como hora absoluta) para no depender
+            # del reloj del balanceador
+            plazo = poll_interval * max_attempts + PLAZO_MARGEN
+            task_id = self._enviar_tarea(xml_content, prioridad, tipo_servicio, formato_salida, calidad, plazo)
             if not task_id:
                 raise Exception("Error al crear tarea en el balanceador")
-            with self.lock:
-                self.tareas_activas[task_id] = {
-                    "status": "procesando",
-                    "timestamp": time.time(),
-                    "xml_content": xml_content,
-                    "prioridad": prioridad
-                }
+            self.almacen.registrar(task_id, {
+                "status": "procesando",
+                "timestamp": time.time(),
+                "prioridad": prioridad
+            })
             attempts = 0
             while attempts < max_attempts:
-                time.sleep(poll_interval)
+                # En lugar de dormir poll_interval, se espera a que el monitor despierte la tarea
+                tarea_info = self.almacen.esperar(task_id, poll_interval)
                 attempts += 1
-                with self.lock:
-                    if task_id in self.tareas_activas:
-                        tarea_info = self.tareas_activas[task_id]
-                        if tarea_info["status"] == "completado":
-                            resultado = {
-                                "success": True,
-                                "task_id": task_id,
-                                "xml_result": tarea_info.get("xml_result", ""),
-                                "tiempo_proceso": tarea_info.get("tiempo_proceso", 0),
-                                "nodo_procesado": tarea_info.get("nodo_procesado", ""),
-                                "attempts": attempts
-                            }
-                            del self.tareas_activas[task_id]
-                            # Notificación al final del método (éxito)
-                            enviar_notificacion(f"Procesamiento de imágenes auto completado para task_id {task_id}")
-                            return resultado
-                        elif tarea_info["status"] == "error":
-                            error_msg = tarea_info.get("error", "Error desconocido")
-                            del self.tareas_activas[task_id]
-                            # Notificación al final del método (error)
-                            enviar_notificacion(f"Procesamiento de imágenes auto fallido para task_id {task_id}: {error_msg}")
-                            return {"success": False, "error": error_msg, "task_id": task_id}
-            with self.lock:
-                if task_id in self.tareas_activas:
-                    del self.tareas_activas[task_id]
+                if cliente_conectado is not None and not cliente_conectado():
+                    self._cancelar_tarea(task_id)
+                    enviar_notificacion(f"Procesamiento de imágenes auto cancelado para task_id {task_id}: cliente desconectado")
+                    return {"success": False, "error": "Cliente desconectado", "task_id": task_id}
+                if tarea_info is None:
+                    continue
+                if tarea_info["status"] == "completado":
+                    resultado = {
+                        "success": True,
+                        "task_id": task_id,
+                        "xml_result": tarea_info.get("xml_result", ""),
+                        "tiempo_proceso": tarea_info.get("tiempo_proceso", 0),
+                        "nodo_procesado": tarea_info.get("nodo_procesado", ""),
+                        "attempts": attempts
+                    }
+                    self.almacen.retirar(task_id)
+                    # Notificación al final del método (éxito)
+                    enviar_notificacion(f"Procesamiento de imágenes auto completado para task_id {task_id}")
+                    return resultado
+                elif tarea_info["status"] == "error":
+                    error_msg = tarea_info.get("error", "Error desconocido")
+                    self.almacen.retirar(task_id)
+                    # Notificación al final del método (error)
+                    enviar_notificacion(f"Procesamiento de imágenes auto fallido para task_id {task_id}: {error_msg}")
+                    return {"success": False, "error": error_msg, "task_id": task_id}
+            self._cancelar_tarea(task_id)
             # Notificación al final del método (timeout)
             enviar_notificacion(f"Procesamiento de imágenes auto timeout para task_id {task_id}")
             return {"success": False, "error": f"Timeout después de {max_attempts} intentos", "task_id": task_id}
@@ -170,22 +329,56 @@ class SOAPImageService:
             enviar_notificacion(f"Error en procesamiento de imágenes auto: {str(e)}")
             return {"success": False, "error": f"Error del servidor: {str(e)}"}
 
+    def _enviar_tarea(self, xml_content, prioridad, tipo_servicio, formato_salida, calidad, plazo):
+        with self._conexion() as cliente:
+            if self.soporta_plazo is False:
+                return cliente.procesar_tarea(xml_content, prioridad, tipo_servicio, formato_salida, calidad)
+            try:
+                task_id = cliente.procesar_tarea(xml_content, prioridad, tipo_servicio, formato_salida, calidad, plazo)
+            except xmlrpc.client.Fault as e:
+                # Sólo se reintenta si el balanceador rechazó el argumento extra: en ese caso
+                # la tarea no llegó a crearse y reenviarla no la duplica
+                if not ("TypeError" in e.faultString and "positional argument" in e.faultString):
+                    raise
+                print("Balanceador sin soporte de plazo, se envían las tareas sin él")
+                self.soporta_plazo = False
+                return cliente.procesar_tarea(xml_content, prioridad, tipo_servicio, formato_salida, calidad)
+            self.soporta_plazo = True
+            return task_id
+
+    def _cancelar_tarea(self, task_id):
+        """Retira la tarea y avisa al balanceador para que no siga procesando un resultado que nadie leerá."""
+        tarea = self.almacen.retirar(task_id)
+        if tarea is None or tarea.get("status") != "procesando":
+            return
+        try:
+            with self._conexion() as cliente:
+                cancelada = cliente.cancelar_tarea(task_id)
+        except Exception as e:
+            print(f"Error cancelando tarea {task_id} en balanceador: {e}")
+            return
+        # Si la tarea ya había terminado o vencido en el balanceador no se recupera capacidad
+        if cancelada is True:
+            self.almacen.contabilizar_cancelacion(time.time() - tarea.get("timestamp", time.time()))
+
     def obtener_estadisticas(self):
         try:
-            if not self.balanceador_client:
-                self._conectar_balanceador()
-                if not self.balanceador_client:
-                    return {"error": "No conectado al balanceador"}
-            stats_json = self.balanceador_client.obtener_estadisticas()
+            if self.estado != "ready":
+                return {"error": "No conectado al balanceador"}
+            with self._conexion() as cliente:
+                stats_json = cliente.obtener_estadisticas()
             if stats_json:
                 stats = json.loads(stats_json)
             else:
                 stats = {}
-            with self.lock:
-                stats["servidor_soap"] = {
-                    "tareas_activas_soap": len(self.tareas_activas),
-                    "balanceador_conectado": self.balanceador_client is not None
-                }
+            stats["servidor_soap"] = {
+                "tareas_activas_soap": self.almacen.contar(),
+                **self.almacen.metricas(),
+                "balanceador_conectado": self.balanceador_client is not None,
+                "estado": self.estado,
+                "tiempo_hasta_listo": self.tiempo_hasta_listo,
+                "pid": os.getpid()
+            }
             # Notificación al final del método
             enviar_notificacion("Estadísticas obtenidas exitosamente")
             return stats
@@ -194,7 +387,9 @@ class SOAPImageService:
             enviar_notificacion(f"Error obteniendo estadísticas: {str(e)}")
             return {"error": f"Error obteniendo estadísticas: {str(e)}"}
 
-soap_service = SOAPImageService()
+# En modo prefork cada trabajador crea su propio servicio tras el fork y el monitor vive
+# sólo en el proceso coordinador, así que el proceso principal no abre conexiones
+soap_service = SOAPImageService() if GATEWAY_WORKERS <= 1 else None
 
 @app.route('/soap', methods=['POST', 'OPTIONS'])
 def soap_endpoint():
@@ -204,6 +399,13 @@ def soap_endpoint():
         response.headers.add("Access-Control-Allow-Headers", "Content-Type, SOAPAction, Authorization")
         response.headers.add("Access-Control-Allow-Methods", "POST, OPTIONS")
         return response
+    llegada = time.time()
+    response = _despachar_soap()
+    if CAPTURA_TRAFICO and random.random() < CAPTURA_MUESTREO:
+        capturar_peticion(request.data, llegada, time.time() - llegada, response.status_code)
+    return response
+
+def _despachar_soap():
     try:
         soap_content = request.data.decode('utf-8')
         soap_tree = ET.fromstring(soap_content)
@@ -229,6 +431,58 @@ def soap_endpoint():
     except Exception as e:
         return crear_soap_fault("Server", f"Error del servidor: {str(e)}")
 
+def capturar_peticion(datos, llegada, latencia, status):
+    """Agrega al archivo de captura un registro de la petición SOAP (nunca rompe la respuesta)."""
+    try:
+        operacion = None
+        parametros = {}
+        try:
+            body = ET.fromstring(datos).find('.//{http://schemas.xmlsoap.org/soap/envelope/}Body')
+            for child in body if body is not None else []:
+                operacion = child.tag.split('}')[-1]
+                for param in child:
+                    nombre = param.tag.split('}')[-1]
+                    if nombre != 'xml_content':
+                        parametros[nombre] = param.text
+                break
+        except ET.ParseError:
+            pass
+        registro = {
+            "operacion": operacion,
+            "parametros": parametros,
+            "sha256": hashlib.sha256(datos).hexdigest(),
+            "tamano": len(datos),
+            "llegada": llegada,
+            "latencia": round(latencia, 6),
+            "status": status
+        }
+        if len(datos) <= CAPTURA_MAX_BYTES:
+            registro["body"] = datos.decode('utf-8', errors='replace')
+        linea = (json.dumps(registro, ensure_ascii=False) + "\n").encode("utf-8")
+        # Un único write sobre un descriptor O_APPEND: en modo prefork varios procesos
+        # escriben el mismo archivo y así las líneas no se intercalan
+        fd = os.open(CAPTURA_ARCHIVO, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, linea)
+        finally:
+            os.close(fd)
+    except Exception as e:
+        print(f"Error capturando petición: {str(e)}")
+
+def _detector_desconexion():
+    """Devuelve una función que indica si el cliente HTTP sigue conectado (None si no se puede saber)."""
+    conexion = request.environ.get("werkzeug.socket")
+    if conexion is None:
+        return None
+    def cliente_conectado():
+        try:
+            return conexion.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) != b""
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+    return cliente_conectado
+
 def manejar_procesar_imagenes_auto(body):
     try:
         ns = {'tns': 'http://servidor.procesamiento.imagenes/soap'}
@@ -252,7 +506,8 @@ def manejar_procesar_imagenes_auto(body):
                                                        formato_salida=formato_salida,
                                                        calidad=calidad,
                                                        poll_interval=poll_interval,
-                                                       max_attempts=max_attempts)
+                                                       max_attempts=max_attempts,
+                                                       cliente_conectado=_detector_desconexion())
         if resultado.get("success"):
             soap_response = f"""<?xml version="1.0" encoding="UTF-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"
@@ -354,16 +609,133 @@ def wsdl_endpoint():
 
 @app.route('/health', methods=['GET'])
 def health_check():
+    listo = soap_service.estado == "ready"
+    # 503 mientras calienta para que el balanceador de carga no envíe tráfico antes de tiempo
     return {
-        "status": "healthy",
+        "status": "healthy" if listo else "warming",
         "service": "Servidor SOAP - Procesamiento de Imágenes",
         "timestamp": time.time(),
         "balanceador_conectado": soap_service.balanceador_client is not None,
-        "tareas_activas": len(soap_service.tareas_activas)
-    }
+        "conexiones_listas": soap_service.pool.qsize(),
+        "tiempo_hasta_listo": soap_service.tiempo_hasta_listo,
+        "tareas_activas": soap_service.almacen.contar(),
+        "workers": GATEWAY_WORKERS
+    }, 200 if listo else 503
+
+def _preparar_hijo(padre):
+    """Los hijos terminan solos si muere el proceso principal, aunque no haya podido limpiar."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    def vigilar_padre():
+        while os.getppid() == padre:
+            time.sleep(1)
+        os._exit(0)
+    threading.Thread(target=vigilar_padre, daemon=True).start()
+
+def _proceso_coordinador(direccion, authkey, padre):
+    """Único proceso que monitorea el balanceador; sirve el estado de tareas a los trabajadores."""
+    _preparar_hijo(padre)
+    almacen = AlmacenTareas()
+    SOAPImageService(almacen=almacen, monitor=True, con_pool=False)
+    ManagerAlmacen.register("almacen", callable=lambda: almacen)
+    manager = ManagerAlmacen(address=direccion, authkey=authkey)
+    print(f"Coordinador de tareas escuchando en {direccion}")
+    manager.get_server().serve_forever()
+
+def _proceso_trabajador(fd, direccion, authkey, padre):
+    global soap_service
+    _preparar_hijo(padre)
+    ManagerAlmacen.register("almacen")
+    manager = ManagerAlmacen(address=direccion, authkey=authkey)
+    for _ in range(50):
+        try:
+            manager.connect()
+            break
+        except (FileNotFoundError, ConnectionRefusedError):
+            time.sleep(0.1)
+    else:
+        manager.connect()
+    soap_service = SOAPImageService(almacen=manager.almacen(), monitor=False)
+    servidor = make_server("0.0.0.0", 0, app, threaded=True, fd=fd)
+    print(f"Trabajador {os.getpid()} atendiendo peticiones")
+    servidor.serve_forever()
+
+def _liberar_socket_coordinador(ruta):
+    """Borra un socket abandonado; si otro coordinador sigue atendiendo en él, no lo toca."""
+    if not os.path.exists(ruta):
+        return
+    prueba = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        prueba.connect(ruta)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(ruta)
+        return
+    finally:
+        prueba.close()
+    raise RuntimeError(f"Otro coordinador está usando {ruta}")
+
+def ejecutar_prefork(puerto, workers):
+    """Levanta un coordinador y N trabajadores que comparten el mismo socket de escucha.
+
+    Los trabajadores que mueren se reinician; si muere el coordinador se apaga todo,
+    porque sin él ningún trabajador puede consultar el estado de tareas.
+    """
+    # SIGTERM (systemd, docker) sale por el finally igual que Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *a: sys.exit(0))
+    padre = os.getpid()
+    authkey = os.urandom(16)
+    ctx = multiprocessing.get_context("fork")
+    coordinador = None
+    sock = None
+    socket_propio = False
+    trabajadores = {}
+
+    def lanzar_trabajador():
+        p = ctx.Process(target=_proceso_trabajador, args=(sock.fileno(), GATEWAY_SOCKET, authkey, padre), daemon=True)
+        p.start()
+        trabajadores[p.sentinel] = p
+
+    try:
+        # Primero el puerto: si otro gateway sigue vivo falla aquí sin tocar su coordinador
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("0.0.0.0", puerto))
+        sock.listen(128)
+        _liberar_socket_coordinador(GATEWAY_SOCKET)
+        coordinador = ctx.Process(target=_proceso_coordinador, args=(GATEWAY_SOCKET, authkey, padre), daemon=True)
+        coordinador.start()
+        socket_propio = True
+        for _ in range(workers):
+            lanzar_trabajador()
+        while True:
+            listos = wait([coordinador.sentinel] + list(trabajadores))
+            if coordinador.sentinel in listos:
+                print(f"❌ Coordinador terminó con código {coordinador.exitcode}, apagando trabajadores")
+                break
+            for sentinel in listos:
+                p = trabajadores.pop(sentinel)
+                p.join()
+                print(f"❌ Trabajador {p.pid} terminó con código {p.exitcode}, reiniciando")
+                time.sleep(0.5)  # evita un bucle de reinicios si el fallo es inmediato
+                lanzar_trabajador()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        procesos = list(trabajadores.values()) + ([coordinador] if coordinador is not None else [])
+        for p in procesos:
+            p.terminate()
+        for p in procesos:
+            p.join(timeout=5)
+        if sock is not None:
+            sock.close()
+        if socket_propio and os.path.exists(GATEWAY_SOCKET):
+            os.unlink(GATEWAY_SOCKET)
 
 if __name__ == "__main__":
     puerto = int(os.environ.get("PORT", 5001))
     print("Servidor SOAP iniciando...")
     print(f"Escuchando en 0.0.0.0:{puerto}")
-    app.run(host='0.0.0.0', port=puerto, debug=False, threaded=True)
\ No newline at end of file
+    if GATEWAY_WORKERS > 1:
+        print(f"Modo prefork: {GATEWAY_WORKERS} trabajadores")
+        ejecutar_prefork(puerto, GATEWAY_WORKERS)
+    else:
+        app.run(host='0.0.0.0', port=puerto, debug=False, threaded=True)
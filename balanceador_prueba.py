@@ -0,0 +1,118 @@
+# balanceador_prueba.py
+# Balanceador RPC de reemplazo para pruebas locales del servidor SOAP.
+# Simula el procesamiento con una espera configurable y modela deadlines y cancelaciones,
+# contabilizando el trabajo desperdiciado que se recupera al cancelar.
+import os
+import threading
+import time
+import json
+import uuid
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+SIM_TIEMPO_PROCESO = float(os.environ.get("SIM_TIEMPO_PROCESO", "2.0"))
+SIM_PASO = 0.1  # granularidad con la que el trabajo simulado revisa cancelaciones
+
+class ManejadorKeepAlive(SimpleXMLRPCRequestHandler):
+    # Con HTTP/1.0 el socket se cierra tras cada llamada y las conexiones previas del gateway no sirven
+    protocol_version = "HTTP/1.1"
+
+class ServidorRPCConcurrente(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def __init__(self, direccion, **kwargs):
+        kwargs.setdefault("requestHandler", ManejadorKeepAlive)
+        super().__init__(direccion, **kwargs)
+
+class BalanceadorPrueba:
+    def __init__(self, tiempo_proceso=SIM_TIEMPO_PROCESO):
+        self.tiempo_proceso = tiempo_proceso
+        self.tareas = {}
+        self.lock = threading.Lock()
+        self.estadisticas = {
+            "tareas_recibidas": 0,
+            "tareas_completadas": 0,
+            "tareas_canceladas": 0,
+            "tareas_vencidas": 0,
+            "segundos_desperdiciados": 0.0
+        }
+
+    def ping(self):
+        return "pong"
+
+    def procesar_tarea(self, xml_content, prioridad=5, tipo_servicio="procesamiento_batch",
+                       formato_salida="JPEG", calidad=85, plazo=None):
+        # El plazo llega en segundos relativos y se convierte con el reloj local
+        deadline = time.time() + plazo if plazo is not None else None
+        task_id = str(uuid.uuid4())
+        with self.lock:
+            self.tareas[task_id] = {"status": "procesando", "inicio": time.time(),
+                                    "deadline": deadline}
+            self.estadisticas["tareas_recibidas"] += 1
+        threading.Thread(target=self._trabajar, args=(task_id, xml_content), daemon=True).start()
+        return task_id
+
+    def _trabajar(self, task_id, xml_content):
+        transcurrido = 0.0
+        while transcurrido < self.tiempo_proceso:
+            with self.lock:
+                tarea = self.tareas.get(task_id)
+                if tarea is None:
+                    return  # cancelada
+                if tarea["deadline"] is not None and time.time() > tarea["deadline"]:
+                    # Nadie leerá el resultado: se abandona el trabajo
+                    tarea["status"] = "error"
+                    tarea["error"] = "Deadline vencido"
+                    self.estadisticas["tareas_vencidas"] += 1
+                    self.estadisticas["segundos_desperdiciados"] += time.time() - tarea["inicio"]
+                    return
+            time.sleep(SIM_PASO)
+            transcurrido += SIM_PASO
+        with self.lock:
+            tarea = self.tareas.get(task_id)
+            if tarea is None:
+                return
+            tarea["status"] = "completado"
+            tarea["resultado"] = xml_content
+            tarea["tiempo_proceso"] = round(time.time() - tarea["inicio"], 3)
+            self.estadisticas["tareas_completadas"] += 1
+
+    def cancelar_tarea(self, task_id):
+        with self.lock:
+            tarea = self.tareas.get(task_id)
+            if tarea is None or tarea["status"] != "procesando":
+                return False
+            del self.tareas[task_id]
+            self.estadisticas["tareas_canceladas"] += 1
+            self.estadisticas["segundos_desperdiciados"] += time.time() - tarea["inicio"]
+            return True
+
+    def obtener_resultado(self, task_id):
+        with self.lock:
+            tarea = self.tareas.get(task_id)
+            if tarea is None:
+                return json.dumps({"status": "error", "error": "Tarea no encontrada"})
+            if tarea["status"] == "procesando":
+                return json.dumps({"status": "procesando"})
+            if tarea["status"] == "completado":
+                del self.tareas[task_id]
+                return json.dumps({"status": "completado", "resultado": tarea["resultado"],
+                                   "tiempo_proceso": tarea["tiempo_proceso"],
+                                   "nodo_procesado": "balanceador_prueba"})
+            del self.tareas[task_id]
+            return json.dumps({"status": "error", "error": tarea.get("error", "Error desconocido")})
+
+    def obtener_estadisticas(self):
+        with self.lock:
+            stats = dict(self.estadisticas)
+            stats["segundos_desperdiciados"] = round(stats["segundos_desperdiciados"], 3)
+            stats["tareas_en_proceso"] = sum(1 for t in self.tareas.values() if t["status"] == "procesando")
+        return json.dumps(stats)
+
+if __name__ == "__main__":
+    puerto = int(os.environ.get("PORT", 8000))
+    servidor = ServidorRPCConcurrente(("0.0.0.0", puerto), allow_none=True, logRequests=False)
+    servidor.register_instance(BalanceadorPrueba())
+    print("Balanceador de prueba iniciando...")
+    print(f"Escuchando en 0.0.0.0:{puerto}")
+    servidor.serve_forever()
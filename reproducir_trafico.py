@@ -0,0 +1,120 @@
+# reproducir_trafico.py
+# Reproduce contra un servidor SOAP el tráfico capturado con CAPTURA_TRAFICO=1 (ver Server.py),
+# respetando los tiempos de llegada originales o acelerándolos N veces, y compara
+# throughput y percentiles de latencia con los valores registrados en la captura.
+import argparse
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+def cargar_registros(archivo):
+    registros = []
+    omitidos = 0
+    with open(archivo, encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            registro = json.loads(linea)
+            # Los registros que superaron CAPTURA_MAX_BYTES sólo tienen hash y no se pueden reenviar
+            if "body" not in registro:
+                omitidos += 1
+                continue
+            registros.append(registro)
+    registros.sort(key=lambda r: r["llegada"])
+    return registros, omitidos
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    # Rango más cercano: el menor valor que cubre al menos el p% de las muestras
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, math.ceil(p / 100.0 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+def resumen(latencias, duracion):
+    return {
+        "peticiones": len(latencias),
+        "throughput": round(len(latencias) / duracion, 3) if duracion > 0 else 0.0,
+        "p50": round(percentil(latencias, 50), 4),
+        "p90": round(percentil(latencias, 90), 4),
+        "p99": round(percentil(latencias, 99), 4),
+        "max": round(max(latencias), 4) if latencias else 0.0
+    }
+
+def reproducir(registros, url, velocidad=1.0, concurrencia=8, timeout=120):
+    """Envía los registros a la url. Con velocidad <= 0 se envían sin esperar entre llegadas."""
+    latencias = []
+    tiempos_servicio = []
+    errores = [0]
+    lock = threading.Lock()
+    sesion_local = threading.local()
+
+    def enviar(registro, programado):
+        # La latencia se mide desde la llegada programada, no desde que un hilo queda libre:
+        # si la concurrencia se satura, la espera en cola también cuenta (coordinated omission)
+        if not hasattr(sesion_local, "sesion"):
+            sesion_local.sesion = requests.Session()
+        inicio = time.time()
+        try:
+            r = sesion_local.sesion.post(url, data=registro["body"].encode("utf-8"),
+                                         headers={"Content-Type": "text/xml; charset=utf-8"},
+                                         timeout=timeout)
+            ok = r.status_code == registro.get("status", 200)
+        except Exception as e:
+            print(f"Error reenviando petición: {str(e)}")
+            ok = False
+        fin = time.time()
+        with lock:
+            latencias.append(fin - programado)
+            tiempos_servicio.append(fin - inicio)
+            if not ok:
+                errores[0] += 1
+
+    t0_original = registros[0]["llegada"] if registros else 0
+    inicio = time.time()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        for registro in registros:
+            if velocidad > 0:
+                programado = inicio + (registro["llegada"] - t0_original) / velocidad
+                espera = programado - time.time()
+                if espera > 0:
+                    time.sleep(espera)
+            else:
+                programado = time.time()
+            pool.submit(enviar, registro, programado)
+    duracion = time.time() - inicio
+    resultado = resumen(latencias, duracion)
+    resultado["servicio"] = resumen(tiempos_servicio, duracion)
+    resultado["errores"] = errores[0]
+    return resultado
+
+def linea_base(registros):
+    if not registros:
+        return resumen([], 0)
+    duracion = registros[-1]["llegada"] + registros[-1]["latencia"] - registros[0]["llegada"]
+    return resumen([r["latencia"] for r in registros], duracion)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproduce tráfico SOAP capturado en JSONL")
+    parser.add_argument("archivo", nargs="?", default="trafico_capturado.jsonl")
+    parser.add_argument("--url", default="http://127.0.0.1:5001/soap")
+    parser.add_argument("--velocidad", type=float, default=1.0,
+                        help="factor de aceleración de los tiempos originales (0 = sin esperas)")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    registros, omitidos = cargar_registros(args.archivo)
+    print(f"Registros a reproducir: {len(registros)} (omitidos sin cuerpo: {omitidos})")
+    base = linea_base(registros)
+    actual = reproducir(registros, args.url, args.velocidad, args.concurrencia, args.timeout)
+    servicio = actual["servicio"]
+    print(f"{'métrica':<12}{'captura':>12}{'reproducción':>14}{'servicio':>12}")
+    for clave in ("peticiones", "throughput", "p50", "p90", "p99", "max"):
+        print(f"{clave:<12}{base[clave]:>12}{actual[clave]:>14}{servicio[clave]:>12}")
+    print("reproducción: latencia desde la llegada programada; servicio: sólo tiempo de respuesta")
+    print(f"errores: {actual['errores']}")
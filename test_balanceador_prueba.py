@@ -0,0 +1,141 @@
+# test_balanceador_prueba.py
+# Ejercita plazos, cancelaciones, desconexiones y el pool de conexiones del gateway
+# contra balanceador_prueba.py corriendo en un hilo.
+import contextlib
+import json
+import threading
+import time
+import xmlrpc.client
+
+import pytest
+
+from balanceador_prueba import BalanceadorPrueba, ServidorRPCConcurrente
+
+@pytest.fixture
+def balanceador():
+    instancia = BalanceadorPrueba(tiempo_proceso=2.0)
+    servidor = ServidorRPCConcurrente(("127.0.0.1", 0), allow_none=True, logRequests=False)
+    servidor.register_instance(instancia)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield instancia, f"http://127.0.0.1:{servidor.server_address[1]}"
+    servidor.shutdown()
+    servidor.server_close()
+
+def estadisticas(url):
+    return json.loads(xmlrpc.client.ServerProxy(url).obtener_estadisticas())
+
+def test_cancelacion_recupera_trabajo(balanceador):
+    _, url = balanceador
+    cliente = xmlrpc.client.ServerProxy(url, allow_none=True)
+    task_id = cliente.procesar_tarea("<a/>", 5, "procesamiento_batch", "JPEG", 85, 10)
+    time.sleep(0.3)
+    assert cliente.cancelar_tarea(task_id) is True
+    assert cliente.cancelar_tarea(task_id) is False
+    stats = estadisticas(url)
+    assert stats["tareas_canceladas"] == 1
+    assert stats["segundos_desperdiciados"] > 0
+    assert stats["tareas_en_proceso"] == 0
+
+def test_plazo_vencido_abandona_trabajo(balanceador):
+    _, url = balanceador
+    cliente = xmlrpc.client.ServerProxy(url, allow_none=True)
+    task_id = cliente.procesar_tarea("<a/>", 5, "procesamiento_batch", "JPEG", 85, 0.2)
+    time.sleep(0.5)
+    assert cliente.cancelar_tarea(task_id) is False
+    assert json.loads(cliente.obtener_resultado(task_id))["error"] == "Deadline vencido"
+    stats = estadisticas(url)
+    assert stats["tareas_vencidas"] == 1
+    assert stats["tareas_canceladas"] == 0
+
+def crear_servicio(balanceador, monkeypatch, monitor):
+    # Server.py necesita las dependencias del gateway; sin ellas sólo corren las pruebas de arriba
+    for modulo in ("flask", "flask_cors", "requests"):
+        pytest.importorskip(modulo)
+    import Server
+    _, url = balanceador
+    monkeypatch.setattr(Server, "BALANCEADOR_RPC_URL", url)
+    monkeypatch.setattr(Server, "enviar_notificacion", lambda *a, **k: None)
+    svc = Server.SOAPImageService(monitor=monitor)
+    for _ in range(50):
+        if svc.estado == "ready":
+            break
+        time.sleep(0.05)
+    assert svc.estado == "ready"
+    return Server, svc
+
+@pytest.fixture
+def servicio(balanceador, monkeypatch):
+    return crear_servicio(balanceador, monkeypatch, monitor=False)
+
+def test_monitor_completa_tarea(balanceador, monkeypatch):
+    instancia, url = balanceador
+    instancia.tiempo_proceso = 0.3
+    _, svc = crear_servicio(balanceador, monkeypatch, monitor=True)
+    resultado = svc.procesar_imagenes_auto("<a/>", poll_interval=1.0, max_attempts=10)
+    assert resultado["success"]
+    assert resultado["xml_result"] == "<a/>"
+    assert resultado["nodo_procesado"] == "balanceador_prueba"
+    assert svc.almacen.contar() == 0
+    assert estadisticas(url)["tareas_completadas"] == 1
+
+def test_timeout_cancela_en_balanceador(balanceador, servicio):
+    _, url = balanceador
+    _, svc = servicio
+    resultado = svc.procesar_imagenes_auto("<a/>", poll_interval=0.2, max_attempts=2)
+    assert not resultado["success"]
+    assert svc.almacen.metricas()["cancelaciones"] == 1
+    assert estadisticas(url)["tareas_canceladas"] == 1
+    assert svc.soporta_plazo is True
+
+def test_desconexion_cancela_en_balanceador(balanceador, servicio):
+    _, url = balanceador
+    _, svc = servicio
+    resultado = svc.procesar_imagenes_auto("<a/>", poll_interval=0.2, max_attempts=10,
+                                           cliente_conectado=lambda: False)
+    assert resultado["error"] == "Cliente desconectado"
+    assert svc.almacen.metricas()["cancelaciones"] == 1
+    assert estadisticas(url)["tareas_canceladas"] == 1
+
+def test_tarea_vencida_no_cuenta_como_cancelacion(balanceador, servicio, monkeypatch):
+    _, url = balanceador
+    Server, svc = servicio
+    # Plazo menor que el timeout del gateway: el balanceador vence la tarea antes de la cancelación
+    monkeypatch.setattr(Server, "PLAZO_MARGEN", -0.3)
+    resultado = svc.procesar_imagenes_auto("<a/>", poll_interval=0.25, max_attempts=2)
+    assert not resultado["success"]
+    assert svc.almacen.metricas() == {"cancelaciones": 0, "segundos_desperdiciados": 0.0}
+    stats = estadisticas(url)
+    assert stats["tareas_vencidas"] == 1
+    assert stats["tareas_canceladas"] == 0
+
+def test_balanceador_sin_plazo_no_duplica_tareas(balanceador, servicio, monkeypatch):
+    instancia, url = balanceador
+    _, svc = servicio
+    original = instancia.procesar_tarea
+    def procesar_tarea(xml_content, prioridad, tipo_servicio, formato_salida, calidad):
+        return original(xml_content, prioridad, tipo_servicio, formato_salida, calidad)
+    monkeypatch.setattr(instancia, "procesar_tarea", procesar_tarea)
+    for _ in range(2):
+        svc.procesar_imagenes_auto("<a/>", poll_interval=0.1, max_attempts=1)
+    assert svc.soporta_plazo is False
+    assert estadisticas(url)["tareas_recibidas"] == 2
+
+def test_conexiones_previas_siguen_abiertas(servicio):
+    Server, svc = servicio
+    assert svc.pool.qsize() == Server.BALANCEADOR_CONEXIONES_PREVIAS
+    with svc._conexion() as cliente:
+        sock = cliente("transport")._connection[1].sock
+        assert sock is not None
+        cliente.ping()
+        # keep-alive: la llamada reutiliza el socket abierto durante el calentamiento
+        assert cliente("transport")._connection[1].sock is sock
+        assert sock.gettimeout() is None
+
+def test_pool_acotado_descarta_conexiones_extra(servicio):
+    _, svc = servicio
+    limite = svc.pool.maxsize
+    with contextlib.ExitStack() as pila:
+        clientes = [pila.enter_context(svc._conexion()) for _ in range(limite + 3)]
+        for cliente in clientes:
+            cliente.ping()
+    assert svc.pool.qsize() == limite
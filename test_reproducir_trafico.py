@@ -0,0 +1,38 @@
+# test_reproducir_trafico.py
+import json
+
+import pytest
+
+pytest.importorskip("requests")
+
+from reproducir_trafico import cargar_registros, linea_base, percentil, resumen
+
+def test_percentil_rango_mas_cercano():
+    assert percentil([1, 2, 3, 4, 5], 50) == 3
+    assert percentil(range(1, 10), 50) == 5
+    assert percentil(range(1, 11), 50) == 5
+    assert percentil(range(1, 11), 90) == 9
+    assert percentil(range(1, 101), 99) == 99
+    assert percentil([5, 1, 3], 100) == 5
+    assert percentil([5, 1, 3], 0) == 1
+    assert percentil([], 50) == 0.0
+
+def test_resumen():
+    datos = resumen([0.1, 0.2, 0.3, 0.4], 2.0)
+    assert datos == {"peticiones": 4, "throughput": 2.0, "p50": 0.2, "p90": 0.4, "p99": 0.4, "max": 0.4}
+    assert resumen([], 0)["throughput"] == 0.0
+
+def test_cargar_registros_ordena_y_omite_sin_cuerpo(tmp_path):
+    archivo = tmp_path / "captura.jsonl"
+    registros = [
+        {"operacion": "obtenerEstadisticas", "llegada": 20.0, "latencia": 0.5, "body": "<b/>"},
+        {"operacion": "procesarImagenesAuto", "llegada": 15.0, "latencia": 1.0, "sha256": "x", "tamano": 99999},
+        {"operacion": "obtenerEstadisticas", "llegada": 10.0, "latencia": 0.1, "body": "<a/>"},
+    ]
+    archivo.write_text("\n".join(json.dumps(r) for r in registros) + "\n\n", encoding="utf-8")
+    cargados, omitidos = cargar_registros(str(archivo))
+    assert omitidos == 1
+    assert [r["body"] for r in cargados] == ["<a/>", "<b/>"]
+    base = linea_base(cargados)
+    assert base["peticiones"] == 2
+    assert base["throughput"] == round(2 / 10.5, 3)
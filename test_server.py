@@ -0,0 +1,187 @@
+# test_server.py
+# Estado de tareas compartido, coordinador por socket Unix, apagado del modo prefork
+# y captura de tráfico del endpoint /soap.
+import hashlib
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import pytest
+
+for modulo in ("flask", "flask_cors", "requests"):
+    pytest.importorskip(modulo)
+
+import Server
+from Server import AlmacenTareas, ManagerAlmacen
+
+def completar_despues(almacen, task_id, segundos):
+    def completar():
+        time.sleep(segundos)
+        almacen.actualizar(task_id, {"status": "completado", "xml_result": "<ok/>"})
+    threading.Thread(target=completar, daemon=True).start()
+
+def test_esperar_despierta_al_actualizar():
+    almacen = AlmacenTareas()
+    almacen.registrar("t1", {"status": "procesando"})
+    completar_despues(almacen, "t1", 0.2)
+    inicio = time.time()
+    tarea = almacen.esperar("t1", 5)
+    assert tarea["status"] == "completado"
+    assert time.time() - inicio < 1
+
+def test_esperar_vence_el_timeout():
+    almacen = AlmacenTareas()
+    almacen.registrar("t1", {"status": "procesando"})
+    inicio = time.time()
+    assert almacen.esperar("t1", 0.2)["status"] == "procesando"
+    assert time.time() - inicio >= 0.2
+
+def test_actualizar_tarea_retirada():
+    almacen = AlmacenTareas()
+    almacen.registrar("t1", {"status": "procesando"})
+    assert almacen.retirar("t1")["status"] == "procesando"
+    assert almacen.actualizar("t1", {"status": "completado"}) is False
+    assert almacen.esperar("t1", 0.1) is None
+    assert almacen.contar() == 0
+
+def test_almacen_por_socket_unix(tmp_path):
+    class ManagerPrueba(ManagerAlmacen):
+        pass
+    almacen = AlmacenTareas()
+    ManagerPrueba.register("almacen", callable=lambda: almacen)
+    direccion = str(tmp_path / "tareas.sock")
+    servidor = ManagerPrueba(address=direccion, authkey=b"clave").get_server()
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    cliente = ManagerPrueba(address=direccion, authkey=b"clave")
+    cliente.connect()
+    proxy = cliente.almacen()
+    proxy.registrar("t1", {"status": "procesando", "prioridad": 5})
+    assert almacen.contar() == 1
+    # El monitor actualiza el almacén local y el trabajador despierta a través del proxy
+    completar_despues(almacen, "t1", 0.2)
+    inicio = time.time()
+    assert proxy.esperar("t1", 5)["xml_result"] == "<ok/>"
+    assert time.time() - inicio < 1
+    proxy.contabilizar_cancelacion(1.5)
+    assert proxy.metricas() == {"cancelaciones": 1, "segundos_desperdiciados": 1.5}
+
+def test_liberar_socket_coordinador(tmp_path):
+    ruta = str(tmp_path / "tareas.sock")
+    vivo = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    vivo.bind(ruta)
+    vivo.listen(1)
+    with pytest.raises(RuntimeError):
+        Server._liberar_socket_coordinador(ruta)
+    assert os.path.exists(ruta)
+    vivo.close()
+    # Socket abandonado (nadie escucha): se borra
+    Server._liberar_socket_coordinador(ruta)
+    assert not os.path.exists(ruta)
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def hijos(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(x) for x in f.read().split()]
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="usa /proc y fork")
+def test_sigterm_apaga_coordinador_y_trabajadores(tmp_path):
+    puerto = puerto_libre()
+    env = dict(os.environ, PORT=str(puerto), GATEWAY_WORKERS="2", BALANCEADOR_IP="127.0.0.1",
+               GATEWAY_SOCKET=str(tmp_path / "tareas.sock"))
+    ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Server.py")
+    gateway = subprocess.Popen([sys.executable, ruta], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(50):
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{puerto}/health")
+            except urllib.error.HTTPError:
+                break  # 503 mientras calienta: ya atiende
+            except OSError:
+                time.sleep(0.1)
+                continue
+            break
+        procesos = hijos(gateway.pid)
+        assert len(procesos) == 3
+        gateway.send_signal(signal.SIGTERM)
+        assert gateway.wait(timeout=10) == 0
+        for pid in procesos:
+            assert not os.path.exists(f"/proc/{pid}") or open(f"/proc/{pid}/stat").read().split()[2] == "Z"
+        assert not os.path.exists(env["GATEWAY_SOCKET"])
+        # El puerto queda libre para el siguiente arranque
+        with socket.socket() as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind(("0.0.0.0", puerto))
+    finally:
+        if gateway.poll() is None:
+            gateway.kill()
+
+SOBRE = """<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"
+               xmlns:tns="http://servidor.procesamiento.imagenes/soap">
+    <soap:Body>
+        <tns:procesarImagenesAuto>
+            <tns:xml_content>&lt;imagenes/&gt;</tns:xml_content>
+            <tns:prioridad>3</tns:prioridad>
+            <tns:calidad>90</tns:calidad>
+        </tns:procesarImagenesAuto>
+    </soap:Body>
+</soap:Envelope>""".encode("utf-8")
+
+def leer_captura(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f]
+
+def test_capturar_peticion_registro(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "captura.jsonl")
+    monkeypatch.setattr(Server, "CAPTURA_ARCHIVO", ruta)
+    Server.capturar_peticion(SOBRE, 100.0, 0.25, 200)
+    Server.capturar_peticion(b"no es xml", 101.0, 0.01, 500)
+    primero, segundo = leer_captura(ruta)
+    assert primero == {
+        "operacion": "procesarImagenesAuto",
+        "parametros": {"prioridad": "3", "calidad": "90"},
+        "sha256": hashlib.sha256(SOBRE).hexdigest(),
+        "tamano": len(SOBRE),
+        "llegada": 100.0,
+        "latencia": 0.25,
+        "status": 200,
+        "body": SOBRE.decode("utf-8")
+    }
+    assert segundo["operacion"] is None
+    assert segundo["parametros"] == {}
+
+def test_capturar_peticion_sin_cuerpo_sobre_el_limite(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "captura.jsonl")
+    monkeypatch.setattr(Server, "CAPTURA_ARCHIVO", ruta)
+    monkeypatch.setattr(Server, "CAPTURA_MAX_BYTES", len(SOBRE) - 1)
+    Server.capturar_peticion(SOBRE, 100.0, 0.25, 200)
+    registro, = leer_captura(ruta)
+    assert "body" not in registro
+    assert registro["sha256"] == hashlib.sha256(SOBRE).hexdigest()
+    assert registro["tamano"] == len(SOBRE)
+
+@pytest.mark.parametrize("muestreo, esperados", [(0.0, 0), (1.0, 3)])
+def test_captura_respeta_muestreo(tmp_path, monkeypatch, muestreo, esperados):
+    ruta = str(tmp_path / "captura.jsonl")
+    monkeypatch.setattr(Server, "CAPTURA_TRAFICO", True)
+    monkeypatch.setattr(Server, "CAPTURA_ARCHIVO", ruta)
+    monkeypatch.setattr(Server, "CAPTURA_MUESTREO", muestreo)
+    monkeypatch.setattr(Server, "enviar_notificacion", lambda *a, **k: None)
+    cliente = Server.app.test_client()
+    sobre = SOBRE.replace(b"procesarImagenesAuto", b"operacionDesconocida")
+    for _ in range(3):
+        assert cliente.post("/soap", data=sobre).status_code == 500
+    capturados = leer_captura(ruta) if os.path.exists(ruta) else []
+    assert len(capturados) == esperados
+    assert all(r["operacion"] == "operacionDesconocida" and r["status"] == 500 for r in capturados)